@@ -1,9 +1,19 @@
 from mesa import Agent, Model # Provides the base classes for the agents and the model
-from mesa.space import MultiGrid # Provides the grid for the agents to move in
 import numpy as np # Handles the position arrays and general required math operations
 import matplotlib.pyplot as plt # Creates the visual ouput for the animation
-from matplotlib.animation import FuncAnimation # Supports the process for the animation creation
-import random # Adds randomness to agent movements
+from matplotlib.animation import FuncAnimation, FFMpegWriter # Supports the process for the animation creation and its encoding
+from matplotlib.colors import ListedColormap # Colours the raster used for the dirty tiles
+import argparse # Reads the command line options for main
+from multiprocessing import Pool # Spreads independent runs across the CPU cores
+from functools import lru_cache # Reuses the step kernel built for a board shape
+try:
+    from numba import njit, prange # Compiles the per-step kernel to native code, spreading its agent loop across cores
+except ImportError: # Numba is optional, without it the kernel simply runs as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+    prange = range
 
 # Set board size constants
 M = 6  # Width
@@ -12,128 +22,202 @@ max_steps = 100
 agent_count = 3
 dirty_count = 12
 
+# Possible moves: left, right, up, down, diagonals
+_MOVES = (
+    (-1, 0),  # left
+    (1, 0),   # right
+    (0, 1),   # up
+    (0, -1),  # down
+    (-1, -1), # left down
+    (1, 1),   # right up
+    (-1, 1),  # left up
+    (1, -1),  # right down
+)
+# Same moves packed like the positions, (dx << 16) + dy wrapped to 32 bits so adding one applies both offsets
+_PACKED_MOVES = np.array([((dx << 16) + dy) & 0xFFFFFFFF for dx, dy in _MOVES], dtype=np.uint32)
+
+# Agent positions are packed into one uint32 as (x << 16) | y, so boards are limited to 65535 cells per side
+def pack(x, y):
+    return (x << 16) | y
+
+# Below this many agents a step is only a few microseconds of work, less than starting the parallel threads costs
+_PARALLEL_MIN_AGENTS = 10_000
+
+# Builds the step kernel for one board shape and agent count, which Numba then compiles as constants
+# (bounds checks against immediates, fixed loop length), cached so every model of the same shape shares it
+@lru_cache(maxsize=None)
+def make_step(width, height, n_agents):
+    # Advances every agent one step in place and returns how many dirty tiles were cleaned
+    @njit(cache=True)
+    def step(packed, moves_made, dirty_mask, move_idx):
+        cleaned = 0
+        # One pass per agent: take the drawn move, staying in place if it would leave the board, then clean where it lands
+        for i in range(n_agents):
+            p = packed[i]
+            new = (np.int64(p) + _PACKED_MOVES[move_idx[i]]) & 0xFFFFFFFF
+            # Leaving the board through 0 wraps a coordinate to 0xFFFF or more, so one unsigned compare per axis covers both edges
+            valid = ((new >> 16) < width) & ((new & 0xFFFF) < height)
+            p = new if valid else p
+            packed[i] = p
+            moves_made[i] += valid # Count only actual moves, every entry in _MOVES changes the position
+            x = p >> 16
+            y = p & 0xFFFF
+            if dirty_mask[x, y]:
+                dirty_mask[x, y] = False
+                cleaned += 1
+        return cleaned
+
+    # Same step with the agents spread across cores, the tiles are then cleared in a second serial pass
+    @njit(parallel=True, cache=True)
+    def step_parallel(packed, moves_made, dirty_mask, move_idx):
+        landed = np.zeros(n_agents, dtype=np.bool_) # Agents that landed on a dirty tile this step
+        # Agents are independent within a step, so they are moved in parallel
+        for i in prange(n_agents):
+            p = packed[i]
+            new = (np.int64(p) + _PACKED_MOVES[move_idx[i]]) & 0xFFFFFFFF
+            valid = ((new >> 16) < width) & ((new & 0xFFFF) < height)
+            p = new if valid else p
+            packed[i] = p
+            moves_made[i] += valid
+            landed[i] = dirty_mask[p >> 16, p & 0xFFFF] # Only read here, several agents may share the tile
+        # Clear the tiles serially so one shared by several agents is only counted once
+        cleaned = 0
+        for i in range(n_agents):
+            if landed[i]:
+                x = packed[i] >> 16
+                y = packed[i] & 0xFFFF
+                if dirty_mask[x, y]:
+                    dirty_mask[x, y] = False
+                    cleaned += 1
+        return cleaned
+
+    return step_parallel if n_agents >= _PARALLEL_MIN_AGENTS else step
+
 # Agent for the board
 class DummyAgent(Agent):
 
     # Initialization for the agent
     def __init__(self, unique_id, model):
         super().__init__(model) # Initializing the base Agent class Mesa offers requires an existing model
-        self.unique_id = unique_id
-        self.next_pos = None #use intent to check  for next position on the board
-        self.moves_made = 0  # Track actual moves
+        self.unique_id = unique_id # Also the agent's index in the model's position and move arrays
 
-    # To get an agent's current position on the baord
-    def get_position(self): 
-        return np.array(self.pos)
+    # The agent's position lives packed in the model's agent_pos array, this is only a view of its entry
+    @property
+    def pos(self):
+        p = int(self.model.agent_pos[self.unique_id])
+        return (p >> 16, p & 0xFFFF)
 
-    # To take a step and possibly move on the board
-    def step(self):
-        self.intent()
-
-    #To check what is and isn't the border
-    def in_bounds(self, pos):
-        x, y = pos
-        return 0 <= x < self.model.grid.width and 0 <= y < self.model.grid.height # Returns true if the position is in bounds
-
-    # How the agent plans to move, decided at random
-    def intent(self):
-        # Possible moves: left, right, up, down, diagonals
-        moves = [
-            np.array([-1, 0]),  # left
-            np.array([1, 0]),   # right
-            np.array([0, 1]),   # up
-            np.array([0, -1]),  # down
-            np.array([-1, -1]), # left down
-            np.array([1, 1]),   # right up
-            np.array([-1, 1]),  # left up
-            np.array([1, -1])   # right down
-        ]
-        move = self.random.choice(moves)
-        new_pos = tuple(self.get_position() + move) # Gets the coordinates for the new position
-        if self.in_bounds(new_pos):
-            self.next_pos = new_pos
-        else:
-            self.next_pos = tuple(self.get_position()) # Stays in place if moved out of bounds
+    @pos.setter
+    def pos(self, value):
+        if value is not None: # Mesa sets pos to None before the agent is placed
+            self.model.agent_pos[self.unique_id] = pack(*value)
 
-    # Make the move on the baord
-    def advance(self):
-        if self.next_pos and self.in_bounds(self.next_pos): # In case it was moved elsewhere, checks again
-            if self.next_pos != self.pos:
-                self.model.grid.move_agent(self, self.next_pos)
-                self.moves_made += 1  # Count only actual moves
+    # Track actual moves, also kept in the model's arrays
+    @property
+    def moves_made(self):
+        return int(self.model.moves_made[self.unique_id])
 
 # Model for the board 
 class DummyModel(Model):
 
     # Initializes by setting itself up with every constant
-    def __init__(self, height=N, width=M, agent_count=agent_count, dirty_count=dirty_count, max_steps=max_steps):
+    def __init__(self, height=N, width=M, agent_count=agent_count, dirty_count=dirty_count, max_steps=max_steps, verbose=True):
         super().__init__() # Initializes the base model class of Mesa
-        self.grid = MultiGrid(width, height, torus=False) # torus=False ensure there is no wrap-around
+        # The board is only its size, agents can share cells and moves off the board are dropped (no wrap-around)
+        self.width = width
+        self.height = height
+        # Agents are stored as arrays, one entry per agent, so a whole step runs inside the step kernel
+        if width < 1 or height < 1:
+            raise ValueError("Board sides must be at least 1 so the agents start on the board")
+        if width > 0xFFFF or height > 0xFFFF:
+            raise ValueError("Board sides must fit in 16 bits for the packed agent positions")
+        self.agent_pos = np.full(agent_count, pack(0, height-1), dtype=np.uint32) # Top left corner
+        self.moves_made = np.zeros(agent_count, dtype=np.int32)
+        self._step = make_step(width, height, agent_count) # Step kernel specialized for this board
         self._agents = {}
         for i in range(agent_count):
             agent = DummyAgent(i, self) # Creates an agent based on the DummyAgent class and this model
-            self.grid.place_agent(agent, (0, N-1)) # Top left corner
             self._agents[i] = agent
-        self.dirty_tiles = []
+        # Agents are never removed, so the filtered view is built once (Mesa also registers agent: None entries here)
+        self._agent_tuple = tuple(agent for agent in self._agents.values() if agent is not None)
+        self.dirty_mask = np.zeros((width, height), dtype=np.bool_) # True where a tile is dirty
+        self._dirty_tiles = None # Coordinate list for dirty_tiles, rebuilt only after the mask changes
         self.dirty_count = dirty_count
+        self.remaining_dirty = 0 # Running count of dirty tiles left, avoids scanning the mask every step
         self.spawn_dirty_tiles()  # Only spawn at the beginning
         self.max_steps = max_steps
+        self.verbose = verbose # Prints the summary once the board is done
         self.current_step = 0
         self.done = False
         self.cleaned_count = 0
         self.last_cleaned_step = None
+        self.history = [] # (dirty tiles, agent positions) per step, only filled by run(record=True)
 
     # Read-only, gets the agents and ensures they can't be changed later
     @property
     def agents(self):
-        return [agent for agent in self._agents.values() if agent is not None]
+        return self._agent_tuple
+
+    # Coordinates of the dirty tiles remaining, only used for drawing
+    @property
+    def dirty_tiles(self):
+        if self._dirty_tiles is None:
+            self._dirty_tiles = [(int(x), int(y)) for x, y in np.argwhere(self.dirty_mask)]
+        return self._dirty_tiles
 
     # Spawns every dirty tile
     def spawn_dirty_tiles(self):
         # Only called once at init
-        needed = self.dirty_count - len(self.dirty_tiles) # In case it's ever needed to call for new dirty tiles mid-simulation
-        free_cells = [
-            (x, y)
-            for x in range(self.grid.width)
-            for y in range(self.grid.height)
-            if self.grid.is_cell_empty((x, y)) and (x, y) not in self.dirty_tiles # Function given by Mesa to check for empty cells
-        ]
-        for _ in range(min(needed, len(free_cells))):
-            self.dirty_tiles.append(random.choice(free_cells))
-            free_cells.remove(self.dirty_tiles[-1]) # Removes the cell that was just chosen so it cannot be picked again
+        needed = self.dirty_count - self.remaining_dirty # In case it's ever needed to call for new dirty tiles mid-simulation
+        height = self.height
+        dirty_flat = self.dirty_mask.ravel() # Flat view of the mask, cell (x, y) lives at index x*height + y
+        occupied = dirty_flat.copy()
+        agent_x = (self.agent_pos >> 16).astype(np.intp)
+        agent_y = (self.agent_pos & 0xFFFF).astype(np.intp)
+        occupied[agent_x * height + agent_y] = True
+        free_idx = np.flatnonzero(~occupied)
+        np.random.shuffle(free_idx) # Shuffled once in place, the first cells are then distinct random picks
+        chosen = free_idx[:max(needed, 0)]
+        dirty_flat[chosen] = True
+        self.remaining_dirty += chosen.size
+        self._dirty_tiles = None
 
     # To make the agents take a step and advance
     def step(self):
         if self.done:
             return
-        for agent in self.agents:
-            agent.step()
-        for agent in self.agents:
-            agent.advance()
-
-        # Mark tiles for deletion if an agent is on them
-        to_remove = []
-        for tile in self.dirty_tiles:
-            for agent in self.agents:
-                if tuple(agent.pos) == tile:
-                    to_remove.append(tile)
-                    break
-        # Actually remove them from the logic
-        for tile in to_remove:
-            self.dirty_tiles.remove(tile)
-            self.cleaned_count += 1
+        move_idx = np.random.randint(0, 8, size=len(self.agent_pos)) # Every agent's random move for this step, drawn at once
+        cleaned = self._step(self.agent_pos, self.moves_made, self.dirty_mask, move_idx)
+        if cleaned:
+            self.remaining_dirty -= cleaned
+            self.cleaned_count += cleaned
+            self._dirty_tiles = None
             self.last_cleaned_step = self.current_step + 1  # + 1 for ease of reading
 
         # Advance the step on the boared
         self.current_step += 1
-        if not self.dirty_tiles or self.current_step >= self.max_steps: # If a finish condition is met, conclude the board
+        if self.remaining_dirty == 0 or self.current_step >= self.max_steps: # If a finish condition is met, conclude the board
             self.done = True
-            self.print_summary()
+            if self.verbose:
+                self.print_summary()
+
+    # Runs the board until it's done, optionally keeping a snapshot of every step for the animation
+    def run(self, record=False):
+        if record:
+            self.history.append(self.snapshot()) # Initial board, before any step
+        while not self.done:
+            self.step()
+            if record:
+                self.history.append(self.snapshot())
+
+    # Dirty tiles and agent positions at the current step
+    def snapshot(self):
+        return (tuple(self.dirty_tiles), tuple(agent.pos for agent in self.agents))
 
     # Summary after baord is done, contains the data for analysis
     def print_summary(self):
-        total_moves = sum(agent.moves_made for agent in self.agents)
-        if not self.dirty_tiles:
+        total_moves = int(self.moves_made.sum())
+        if self.remaining_dirty == 0:
             print(f"All dirty tiles cleaned at step {self.last_cleaned_step}.")
             print(f"Total tiles cleaned: {self.cleaned_count}")
             print(f"Total agent moves: {total_moves}")
@@ -142,20 +226,44 @@ class DummyModel(Model):
             print(f"Total tiles cleaned: {self.cleaned_count}")
             print(f"Total agent moves: {total_moves}")
 
-# Sets up all of the visuals for the animation
+# Runs a single seeded board without printing, returns (tiles cleaned, last cleaning step, total moves)
+def _one(seed):
+    np.random.seed(seed) # Dirty tiles and agent moves are drawn from NumPy's generator
+    model = DummyModel(verbose=False)
+    model.run()
+    return (model.cleaned_count, model.last_cleaned_step, int(model.moves_made.sum()))
+
+# Runs independent boards in parallel, one per seed, given either as a count (seeds 0 to n_runs-1) or as the seeds themselves
+def run_batch(n_runs=None, seeds=None):
+    if (n_runs is None) == (seeds is None):
+        raise ValueError("Pass exactly one of n_runs or seeds")
+    if seeds is None:
+        seeds = range(n_runs)
+    with Pool() as pool:
+        return pool.map(_one, seeds)
+
+# Sets up all of the visuals for the animation, replaying the history recorded by model.run(record=True)
 def animate_agents(model):
     fig, ax = plt.subplots(figsize=(5, 3)) # Creates the screen
     
     # Makes the visual for the board
-    ax.set_xlim(0, model.grid.width)
-    ax.set_ylim(0, model.grid.height)
+    ax.set_xlim(0, model.width)
+    ax.set_ylim(0, model.height)
     ax.set_aspect('equal')
-    ax.set_xticks(np.arange(0, model.grid.width, 1))
-    ax.set_yticks(np.arange(0, model.grid.height, 1))
+    ax.set_xticks(np.arange(0, model.width, 1))
+    ax.set_yticks(np.arange(0, model.height, 1))
     ax.grid(True, which='both') # Turns on grid lines
     scat = ax.scatter([], [], s=200) # Creates the scatter plot to make the dots for the agents
-    texts = [] # Initializes the list for the agent IDs
-    dirty_patches = [] # Initializes the list for the dirty tiles
+    # Dirty tiles are drawn as a single raster, 1 where a tile is dirty and transparent elsewhere
+    mask = np.zeros((model.height, model.width))
+    dirty_image = ax.imshow(mask, extent=(0, model.width, 0, model.height), origin='lower',
+                            cmap=ListedColormap(['none', 'yellow']), alpha=0.3, vmin=0, vmax=1,
+                            interpolation='nearest', animated=True)
+    # One ID text per agent, created once and only moved afterwards
+    agent_ids = [agent.unique_id for agent in model.agents]
+    texts = [ax.text(0, 0, str(agent_id), color='white', ha='center', va='center',
+                     fontsize=8, fontweight='bold', animated=True)
+             for agent_id in agent_ids]
 
     # Colours for up to 10 agents, repeats last colour if more
     colors = ['red', 'blue', 'green', 'yellow', 'pink', 'orange', 'purple', 'brown', 'black', 'grey'] 
@@ -163,52 +271,68 @@ def animate_agents(model):
     # Initializes the animations by ensuring everything is properly reset
     def init():
         scat.set_offsets(np.empty((0, 2))) # Sets up the offsets to show agents on the proper place
+        mask[:] = 0
+        dirty_image.set_data(mask)
         for t in texts:
-            t.remove()
-        texts.clear()
-        for patch in dirty_patches:
-            patch.remove()
-        dirty_patches.clear()
-        return scat, *texts
+            t.set_text('')
+        return dirty_image, scat, *texts
 
     # Function called every step to show updates on the board as agents move
     def update(frame):
-        if frame > 0 and not model.done:
-            model.step()
-        # Remove previous patches to avoid drawing over with new ones
-        for patch in dirty_patches:
-            patch.remove()
-        dirty_patches.clear()
-        # Draw dirty tiles currently remaining
-        for x, y in model.dirty_tiles:
-            dirty_patch = plt.Rectangle((x, y), 1, 1, color='yellow', alpha=0.3)
-            ax.add_patch(dirty_patch)
-            dirty_patches.append(dirty_patch)
+        dirty_tiles, agent_positions = model.history[frame]
+        # Redraw the dirty tiles remaining at this step into the raster
+        mask[:] = 0
+        for x, y in dirty_tiles:
+            mask[y, x] = 1
+        dirty_image.set_data(mask)
         # Draw agents (draw after tiles)
-        positions = np.array([[agent.pos[0]+0.5, agent.pos[1]+0.5] for agent in model.agents]) # Offset so they are on the center of the square
+        positions = np.array([[x+0.5, y+0.5] for x, y in agent_positions]) # Offset so they are on the center of the square
         if positions.size == 0:
             scat.set_offsets(np.empty((0, 2)))
         else:
             scat.set_offsets(positions) # Shows the agents in their current positions
         scat.set_color(colors[:len(positions)])
-        # Removes previous ID text then rewrites it in the correct position
-        for t in texts:
-            t.remove()
-        texts.clear()
-        for idx, agent in enumerate(model.agents):
-            t = ax.text(agent.pos[0]+0.5, agent.pos[1]+0.5, str(agent.unique_id),
-                        color='white', ha='center', va='center', fontsize=8, fontweight='bold')
-            texts.append(t)
-        return scat, *texts
-
-    # Run until either all dirty tiles are gone or max_steps is reached
-    frames = model.max_steps + 1
-    ani = FuncAnimation(fig, update, frames=frames, init_func=init, blit=False, repeat=False) # Calls from a function from the Mesa library
-    ani.save('animation.gif', writer='pillow', fps=2)  # Save as GIF using Pillow
+        # Moves each ID text to its agent's current position
+        for t, agent_id, (x, y) in zip(texts, agent_ids, agent_positions):
+            t.set_position((x+0.5, y+0.5))
+            t.set_text(str(agent_id))
+        return dirty_image, scat, *texts
+
+    # One frame per recorded step, from the initial board until the model was done
+    frames = len(model.history)
+    ani = FuncAnimation(fig, update, frames=frames, init_func=init, blit=True, repeat=False) # Calls from a function from the Mesa library
+    if FFMpegWriter.isAvailable():
+        ani.save('animation.mp4', writer=FFMpegWriter(fps=2, bitrate=800)) # ffmpeg encodes the frames in its own process
+    else:
+        ani.save('animation.gif', writer='pillow', fps=2)  # Save as GIF using Pillow when ffmpeg is not installed
     plt.show() # Displays it
     return
 
-# Board is set up and animation starts
-if __name__ == "__main__":
+# Runs one board from the command line, the animation is only built when asked for
+def main():
+    parser = argparse.ArgumentParser(description="Runs the cleaning agents board.")
+    parser.add_argument('--animate', action='store_true', help="record every step and save the animation")
+    parser.add_argument('--runs', type=int, default=1, help="run this many seeded boards in parallel and print their averages")
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error("--runs must be at least 1")
+    if args.runs > 1 and args.animate:
+        parser.error("--animate only works with a single run")
+    if args.runs > 1:
+        results = run_batch(args.runs)
+        # Only runs that cleaned every tile, the rest stopped at max_steps
+        finished = [last_step for cleaned, last_step, _ in results if cleaned == dirty_count]
+        print(f"Runs: {len(results)}")
+        print(f"Average tiles cleaned: {np.mean([cleaned for cleaned, _, _ in results]):.2f}")
+        print(f"Runs that cleaned every tile: {len(finished)}")
+        if finished:
+            print(f"Average step all tiles were cleaned: {np.mean(finished):.2f}")
+        print(f"Average agent moves: {np.mean([moves for _, _, moves in results]):.2f}")
+        return
     model = DummyModel()
-    animate_agents(model)
\ No newline at end of file
+    model.run(record=args.animate)
+    if args.animate:
+        animate_agents(model)
+
+if __name__ == "__main__":
+    main()